@@ -10,10 +10,12 @@ For now, this is written for disentangling purifications; could be generalized t
 # Copyright 2018-2021 TeNPy Developers, GNU GPLv3
 
 import numpy as np
+import scipy.linalg
 import logging
 logger = logging.getLogger(__name__)
 
 from ..linalg import np_conserved as npc
+from ..linalg.svd_robust import svd as svd_flat
 from .truncation import svd_theta
 from ..tools.math import entropy
 from ..linalg import random_matrix as rand_mat
@@ -104,12 +106,84 @@ class BackwardDisentangler(Disentangler):
         if eng._U_param['type_evo'] == 'imag':
             return theta, None  # doesn't work for this...
         U_idx_dt, i = eng._update_index
-        U = eng._U[U_idx_dt][i].conj()
-        U.ireplace_labels(['p0*', 'p1*', 'p0', 'p1'], ['q0', 'q1', 'q0*', 'q1*'])
+        U = eng._U_bond_disent.get((U_idx_dt, i))
+        if U is None:
+            U = eng._U[U_idx_dt][i].conj()
+            U.ireplace_labels(['p0*', 'p1*', 'p0', 'p1'], ['q0', 'q1', 'q0*', 'q1*'])
+            eng._U_bond_disent[(U_idx_dt, i)] = U
         theta = npc.tensordot(U, theta, axes=[['q0*', 'q1*'], ['q0', 'q1']])
         return theta, U
 
 
+def _renyi_env_blockdiag(M, Mc):
+    r"""Compute ``conj(M M^dagger M)`` blockwise for a block-diagonal matrix `M`.
+
+    For a two-leg array `M` with bunched legs, each charge value appears in a single
+    qindex per leg, so charge conservation pairs each row block with (at most) one column
+    block: `M` is block-diagonal up to permutation. Then ``(M M^dagger M)`` decomposes
+    into ``B B^dagger B`` for each block ``B`` separately, which we compute in a plain
+    loop over the blocks; this skips the qdata matching and accumulation machinery of
+    two :func:`~tenpy.linalg.np_conserved.tensordot` calls doing the same GEMMs.
+
+    Parameters
+    ----------
+    M : :class:`~tenpy.linalg.np_conserved.Array`
+        Two-leg array; blocks are one-to-one between row and column qindices.
+    Mc : :class:`~tenpy.linalg.np_conserved.Array`
+        The conjugate ``M.conj()``; the result shares its metadata.
+
+    Returns
+    -------
+    env : :class:`~tenpy.linalg.np_conserved.Array` | None
+        ``conj(M M^dagger M)`` with the legs (and qdata) of `Mc`,
+        or ``None`` if `M` is not block-diagonal.
+    """
+    qdata = M._qdata
+    if len(qdata) > 1 and (len(np.unique(qdata[:, 0])) < len(qdata)
+                           or len(np.unique(qdata[:, 1])) < len(qdata)):
+        return None  # some qindex appears in several blocks: not block-diagonal
+    env = Mc.copy(deep=False)
+    env._data = [np.conj(np.dot(np.dot(B, B.conj().T), B)) for B in M._data]
+    return env
+
+
+def _polar_max_trace(dS):
+    r"""Find the unitary `U` maximizing ``trace(U dS)`` for a two-leg array `dS`.
+
+    This is the unitary (polar) factor of :math:`dS^\dagger`, obtained blockwise from dense
+    polar decompositions ``B = W P`` of the charge blocks ``B`` of `dS` as ``conj(W)``.
+    The blocks are typically tiny (``d^2 x d^2``), such that going through full
+    :func:`~tenpy.linalg.np_conserved.svd` and :func:`~tenpy.linalg.np_conserved.tensordot`
+    calls would be dominated by the leg bookkeeping; here we keep the block structure of
+    `dS` and just replace the data.
+
+    Returns both the unitary and the maximized ``trace(U dS) = trace(P)``,
+    i.e. the sum of the singular values of `dS`.
+    """
+    U = dS.copy(deep=False)
+    data = []
+    max_trace = 0.
+    for B in dS._data:
+        if B.shape[0] == B.shape[1] and \
+                np.linalg.norm(B - B.T.conj()) <= 1.e-12 * np.linalg.norm(B):
+            # Hermitian block ``B = V w V^H``: the polar factor is ``V sign(w) V^H`` and
+            # the singular values are ``|w|``; `eigh` is ~2x cheaper than an SVD.
+            w, V = np.linalg.eigh(B)
+            W = np.dot(V * np.where(w < 0., -1., 1.), V.T.conj())
+            max_trace += np.sum(np.abs(w))
+        else:
+            try:
+                W, P = scipy.linalg.polar(B)
+                max_trace += np.trace(P).real
+            except np.linalg.LinAlgError:  # (extremely rare) gesdd convergence failure
+                W, Y, VH = svd_flat(B, full_matrices=False)  # robust svd with gesvd fallback
+                W = np.dot(W, VH)
+                max_trace += np.sum(Y)
+        data.append(W)
+    U._data = data
+    return U.iconj(), max_trace
+
+
 class RenyiDisentangler(Disentangler):
     """Iterative find `U` which minimized the second Renyi entropy.
 
@@ -117,45 +191,204 @@ class RenyiDisentangler(Disentangler):
 
     Reads of the following `options` as break criteria for the iteration:
 
-    ================ ====== ======================================================
-    key              type   description
-    ================ ====== ======================================================
-    disent_eps       float  Break, if the change in the Renyi entropy ``S(n=2)``
-                            per iteration is smaller than this value.
-    ---------------- ------ ------------------------------------------------------
-    disent_max_iter  float  Maximum number of iterations to perform.
-    ================ ====== ======================================================
+    ================= ====== =====================================================
+    key               type   description
+    ================= ====== =====================================================
+    disent_eps        float  Break, if the change in the Renyi entropy ``S(n=2)``
+                             per iteration is smaller than this value.
+    ----------------- ------ -----------------------------------------------------
+    disent_rel_eps    float  Also break if the change per iteration is smaller
+                             than this value times the current entropy: at large
+                             entanglement, further iterations yield changes which
+                             are negligible compared to ``S`` itself.
+    ----------------- ------ -----------------------------------------------------
+    disent_max_iter   float  Maximum number of iterations to perform.
+    ----------------- ------ -----------------------------------------------------
+    disent_mixed_prec bool   If True, perform the iterations in single precision
+                             while still far from convergence and switch back to
+                             double precision for the final iterations.
+                             Off by default.
+    ================= ====== =====================================================
 
     Arguments and return values are the same as for :meth:`disentangle`.
     """
+    #: entropy change per iteration below which single precision is no longer enough
+    _mixed_prec_eps = 1.e-5
+
     def __init__(self, parent):
         self.max_iter = parent.options.get('disent_max_iter', 20)
         self.eps = parent.options.get('disent_eps', 1.e-10)
+        self.rel_eps = parent.options.get('disent_rel_eps', 1.e-4)
+        self.mixed_prec = parent.options.get('disent_mixed_prec', False)
         self.parent = parent
+        #: per-bond cache ``i -> [(q0.q1) pipe, conjugate pipe]`` reused across iterations and
+        #: calls; the `q` legs are the (fixed) site legs, so the pipes stay valid for the
+        #: whole evolution. Rebuilt if the legs change (e.g. after swapping sites).
+        self._q_pipes = {}
 
     def __call__(self, theta):
         """Find optimal `U` which minimizes the second Renyi entropy."""
+        if theta.chinfo.qnumber == 0:
+            # without conserved charges, all arrays are single dense blocks:
+            # iterate directly on them, skipping the npc dispatch per iteration
+            return self._call_trivial_charges(theta)
         U_idx_dt, i = self.parent._update_index
-        U = npc.outer(npc.eye_like(theta, 'q0', labels=['q0', 'q0*']),
-                      npc.eye_like(theta, 'q1', labels=['q1', 'q1*']))
+        U = None  # identity; `iter` skips applying it, so the first iteration directly
+        # computes the polar optimum of the environment of `theta` itself.
+        theta_iter = theta
+        if self.mixed_prec:
+            # far from the optimum, single precision is accurate enough (and faster)
+            theta_iter = theta.astype(np.complex64 if theta.dtype.kind == 'c' else np.float32)
+        # bind the names needed in the hot loop locally: for small `d`, the per-iteration
+        # work is tiny and repeated attribute lookups are a measurable fraction of it
+        iter_ = self.iter
+        eps = self.eps
+        rel_eps = self.rel_eps
+        mixed_prec_eps = self._mixed_prec_eps
+        max_iter = self.max_iter
+        # the legs of `U theta` don't change within the iteration: build the pipes once
+        pipes = [theta.make_pipe(['vL', 'p0', 'q0'], qconj=+1),
+                 theta.make_pipe(['vR', 'p1', 'q1'], qconj=-1)]
         Sold = np.inf
+        delta_old = np.inf
         S0 = None
-        for j in range(self.max_iter):
-            S, U = self.iter(theta, U)
+        j = 0
+        while j < max_iter:
+            S, U = iter_(theta_iter, U, pipes)
+            j += 1
             if S0 is None:
                 S0 = S
-            if abs(Sold - S) < self.eps:
+            delta = abs(Sold - S)
+            converged = (delta < max(eps, rel_eps * abs(S))
+                         or (delta < 10. * eps and delta_old < 10. * eps))
+            if theta_iter is not theta and (converged or delta < mixed_prec_eps):
+                # close to the optimum: deliver the stopping criteria (and the final `U`)
+                # in full precision; never break while still iterating in single precision
+                theta_iter = theta
+            elif converged:
                 break
-            Sold, S = S, Sold
+            Sold = S
+            delta_old = delta
+        if U is not None and U.dtype != theta.dtype:
+            # `max_iter` exhausted before the last iteration ran in full precision:
+            # do one more, such that the returned `U` is unitary up to double-precision
+            # rounding no matter how the loop terminated
+            S, U = iter_(theta, U, pipes)
+            j += 1
+            Sold = S
+        if U is None:  # max_iter == 0: never iterated, need an explicit identity
+            U = npc.outer(npc.eye_like(theta, 'q0', labels=['q0', 'q0*']),
+                          npc.eye_like(theta, 'q1', labels=['q1', 'q1*']))
         theta = npc.tensordot(U, theta, axes=[['q0*', 'q1*'], ['q0', 'q1']])
         self.parent._disent_iterations[i] += j  # save the number of iterations performed
         logger.debug("RenyiDisentangler: %(j)d iterations, Sold-S=%(dS).3e", {
             'j': j,
-            'dS': S0 - Sold
+            'dS': S0 - Sold if S0 is not None else 0.  # S0 is None for max_iter == 0
         })
         return theta, U
 
-    def iter(self, theta, U):
+    def _call_trivial_charges(self, theta):
+        """Specialization of :meth:`__call__` for trivial charge conservation.
+
+        Without conserved charges, every npc array consists of a single dense block.
+        The fixed-point iteration then runs directly on the underlying numpy arrays:
+        it contracts the same network as :meth:`iter` (with the shapes fixed by the
+        physical dimension and the bond dimensions, everything reduces to a handful of
+        BLAS/LAPACK calls), but avoids the per-iteration npc leg and charge bookkeeping.
+        Only the final result is wrapped back into npc arrays.
+        """
+        U_idx_dt, i = self.parent._update_index
+        th = theta.transpose(['q0', 'q1', 'vL', 'p0', 'vR', 'p1']).to_ndarray()
+        dq0, dq1, chiL, d0, chiR, d1 = th.shape
+        dq = dq0 * dq1
+        th_iter = th
+        if self.mixed_prec:
+            # far from the optimum, single precision is accurate enough (and faster)
+            th_iter = th.astype(np.complex64 if th.dtype.kind == 'c' else np.float32)
+        thc = th_iter.conj()
+        A = None  # the unitary as application matrix: theta' = A theta on the q-legs
+        eps = self.eps
+        rel_eps = self.rel_eps
+        mixed_prec_eps = self._mixed_prec_eps
+        max_iter = self.max_iter
+        Sold = np.inf
+        delta_old = np.inf
+        S0 = None
+        j = 0
+        while j < max_iter:
+            S, A = self._iter_trivial_charges(th_iter, thc, A)
+            j += 1
+            if S0 is None:
+                S0 = S
+            delta = abs(Sold - S)
+            converged = (delta < max(eps, rel_eps * abs(S))
+                         or (delta < 10. * eps and delta_old < 10. * eps))
+            if th_iter is not th and (converged or delta < mixed_prec_eps):
+                # close to the optimum: deliver the stopping criteria (and the final `U`)
+                # in full precision; never break while still iterating in single precision
+                th_iter = th
+                thc = th.conj()
+            elif converged:
+                break
+            Sold = S
+            delta_old = delta
+        if A is not None and A.dtype != th.dtype:
+            # same as in `__call__`: never return a single-precision unitary
+            S, A = self._iter_trivial_charges(th, th.conj(), A)
+            j += 1
+            Sold = S
+        q0, q1 = theta.get_leg('q0'), theta.get_leg('q1')
+        if A is None:  # max_iter == 0: never iterated
+            A = np.eye(dq)
+        U = npc.Array.from_ndarray(A.reshape(dq0, dq1, dq0, dq1),
+                                   [q0, q1, q0.conj(), q1.conj()],
+                                   dtype=theta.dtype,
+                                   labels=['q0', 'q1', 'q0*', 'q1*'])
+        theta = npc.tensordot(U, theta, axes=[['q0*', 'q1*'], ['q0', 'q1']])
+        self.parent._disent_iterations[i] += j  # save the number of iterations performed
+        logger.debug("RenyiDisentangler: %(j)d iterations, Sold-S=%(dS).3e", {
+            'j': j,
+            'dS': S0 - Sold if S0 is not None else 0.  # S0 is None for max_iter == 0
+        })
+        return theta, U
+
+    def _iter_trivial_charges(self, th, thc, A):
+        """One iteration of :meth:`_call_trivial_charges`, the dense analogue of :meth:`iter`.
+
+        Parameters
+        ----------
+        th : ndarray
+            Dense `theta` with axes ``q0, q1, vL, p0, vR, p1``.
+        thc : ndarray
+            The conjugate ``th.conj()``.
+        A : ndarray | None
+            The previous guess for the unitary as application matrix:
+            ``theta' = A theta`` on the (flattened) `q` legs; ``None`` for the identity.
+
+        Returns
+        -------
+        S2 : float
+            Renyi entropy (n=2) evaluated at the polar optimum, as in :meth:`iter`.
+        A : ndarray
+            Updated application matrix, see above.
+        """
+        dq0, dq1, chiL, d0, chiR, d1 = th.shape
+        dq = dq0 * dq1
+        if A is None:  # identity
+            Uth = th
+        else:
+            Uth = np.dot(A, th.reshape(dq, -1)).reshape(th.shape)
+        # M = U theta as matrix (vL.p0.q0) x (vR.p1.q1), as in `iter`
+        M = Uth.transpose(2, 3, 0, 4, 5, 1).reshape(chiL * d0 * dq0, chiR * d1 * dq1)
+        N = np.dot(np.dot(M, M.conj().T), M)
+        N = N.reshape(chiL, d0, dq0, chiR, d1, dq1)
+        # environment: contract theta* with N over 'vL', 'p0', 'vR', 'p1'
+        dS = np.tensordot(thc, N, axes=([2, 3, 4, 5], [0, 1, 3, 4])).conj()
+        W, P = scipy.linalg.polar(dS.reshape(dq, dq))
+        A = W.conj().T  # the unitary maximizing trace(U dS), as application matrix
+        return -np.log(np.trace(P).real), A
+
+    def iter(self, theta, U, pipes=None):
         r"""Given `theta` and `U`, find another `U` which reduces the 2nd Renyi entropy.
 
         Temporarily view the different `U` as independt and mimizied one of them -
@@ -184,36 +417,73 @@ class RenyiDisentangler(Disentangler):
         ----------
         theta : :class:`~tenpy.linalg.np_conserved.Array`
             Two-site wave function to be disentangled.
-        U : :class:`~tenpy.linalg.np_conserved.Array`
+        U : :class:`~tenpy.linalg.np_conserved.Array` | None
             The previous guess for `U`; with legs ``'q0', 'q1', 'q0*', 'q1*'``.
+            ``None`` stands for the identity (which then doesn't need to be applied).
+        pipes : None | list of :class:`~tenpy.linalg.charges.LegPipe`
+            Optional pipes for combining the legs ``['vL', 'p0', 'q0']`` and
+            ``['vR', 'p1', 'q1']``: the contraction pattern is the same in each iteration,
+            so the caller can compute them once and reuse them.
 
         Returns
         -------
         S2 : float
-            Renyi entopy (n=2), :math:`S2 = \frac{1}{1-2} \log tr(\rho_L^2)` of `U theta`.
+            Renyi entopy (n=2), :math:`S2 = \frac{1}{1-2} \log tr(\rho_L^2)` evaluated at the
+            polar optimum, i.e. ``S2 = Tr(new_U dS)``, the sum of the singular values of `dS`.
         new_U : :class:`~tenpy.linalg.np_conserved.Array`
             Unitary with legs ``'q0', 'q1', 'q0*', 'q1*'``, which should disentangle `theta`.
         """
-        U_theta = npc.tensordot(U, theta, axes=[['q0*', 'q1*'], ['q0', 'q1']])
+        if U is None:  # identity
+            U_theta = theta
+        else:
+            U_theta = npc.tensordot(U, theta, axes=[['q0*', 'q1*'], ['q0', 'q1']])
         # same legs as theta: 'vL', 'p0', 'q0', 'p1', 'q1', 'vR'
-        # contract diagram from bottom to top
-        dS = npc.tensordot(U_theta,
-                           U_theta.conj(),
-                           axes=[['p1', 'q1', 'vR'], ['p1*', 'q1*', 'vR*']])
-        # dS has legs 'vL', 'p0', 'q0', 'vL*', 'p0*', 'q0*'
-        dS = npc.tensordot(U_theta.conj(), dS, axes=[['vL*', 'p0*', 'q0*'], ['vL', 'p0', 'q0']])
-        # dS has legs 'vL', 'p0', 'q0', 'vR', 'p1', 'q1'
+        # contract diagram from bottom to top.
+        # Viewing `U_theta` as a matrix ``M`` with combined legs ``(vL.p0.q0), (vR.p1.q1)``,
+        # the lower three layers of the diagram are just ``conj(M M^dagger M)``.
+        # Expressing them as the (blockwise) GEMM chain ``conj((M M^dagger) M)`` avoids the
+        # rank-6 intermediates with separate legs (and the leg bookkeeping they require);
+        # `Mc` is reused for both products, so only one conjugate copy is made per iteration.
+        # Only the last step, closing the network with `theta` while keeping the `q` legs
+        # open, genuinely needs the legs split again.
+        M = U_theta.combine_legs([['vL', 'p0', 'q0'], ['vR', 'p1', 'q1']],
+                                 pipes=pipes,
+                                 qconj=[+1, -1])
+        Mc = M.conj()
+        dS = _renyi_env_blockdiag(M, Mc)  # conj(M M^dagger M) with one GEMM pair per sector
+        if dS is None:  # fall back to generic contractions
+            dS = npc.tensordot(Mc, M, axes=[['(vR*.p1*.q1*)'], ['(vR.p1.q1)']])
+            # dS = conj(M M^dagger); legs '(vL*.p0*.q0*)', '(vL.p0.q0)'
+            dS = npc.tensordot(dS, Mc, axes=[['(vL.p0.q0)'], ['(vL*.p0*.q0*)']])
+        # dS = conj(M M^dagger M); legs '(vL*.p0*.q0*)', '(vR*.p1*.q1*)'
         dS = npc.tensordot(theta,
-                           dS,
+                           dS.split_legs(),
                            axes=[['vL', 'p0', 'vR', 'p1'], ['vL*', 'p0*', 'vR*', 'p1*']])
-        S2 = npc.inner(U, dS, axes=[['q0', 'q1', 'q0*', 'q1*'], ['q0*', 'q1*', 'q0', 'q1']])
         # dS has legs 'q0', 'q1', 'q0*', 'q1*'
-        dS = dS.combine_legs([['q0', 'q1'], ['q0*', 'q1*']], qconj=[+1, -1])
-        # Find unitary which maximizes `trace(U dS)`.
-        W, Y, VH = npc.svd(dS)
-        new_U = npc.tensordot(W, VH, axes=[1, 0]).conj()  # == V W^dagger.
-        # this yields trace(U dS) = trace(Y), which is maximal.
-        return -np.log(S2.real), new_U.split_legs([0, 1])
+        dS = dS.combine_legs([['q0', 'q1'], ['q0*', 'q1*']], pipes=self._get_q_pipes(theta))
+        # Find unitary which maximizes `trace(U dS)`, i.e. ``V W^dagger`` for ``dS = W Y V^H``.
+        # At the polar optimum, ``S2 = trace(new_U dS) = sum(Y)``, the sum of the singular
+        # values of `dS`; this saves the contraction `npc.inner(U, dS, ...)` per iteration.
+        new_U, S2 = _polar_max_trace(dS)
+        return -np.log(S2), new_U.split_legs([0, 1])
+
+    def _get_q_pipes(self, theta):
+        """Get (cached) pipes to combine the ``'q0', 'q1'`` and ``'q0*', 'q1*'`` legs of `dS`.
+
+        Building a :class:`~tenpy.linalg.charges.LegPipe` sorts and bunches the fused charges,
+        which is pure python overhead repeated identically in each iteration of each call;
+        since the `q` legs of `theta` don't change during the evolution, we can keep the pipes
+        around for the whole run.
+        """
+        idx = self.parent._update_index
+        i = idx[1] if idx is not None else None
+        q0, q1 = theta.get_leg('q0'), theta.get_leg('q1')
+        pipes = self._q_pipes.get(i)
+        if pipes is None or pipes[0].legs[0] is not q0 or pipes[0].legs[1] is not q1:
+            pipe = npc.LegPipe([q0, q1], qconj=+1)
+            pipes = [pipe, pipe.conj()]
+            self._q_pipes[i] = pipes
+        return pipes
 
 
 class NormDisentangler(Disentangler):
@@ -302,10 +572,9 @@ class NormDisentangler(Disentangler):
                            axes=[['vL', 'vR', 'p0', 'p1'], ['vL*', 'vR*', 'p0*', 'p1*']])
         # dS has legs 'q0', 'q1', 'q0*', 'q1*'
         dS = dS.combine_legs([['q0', 'q1'], ['q0*', 'q1*']], qconj=[+1, -1])
-        # Find unitary U2 which maximizes `trace(U dS)`.
-        W, Y, VH = npc.svd(dS)
-        new_U = npc.tensordot(W, VH, axes=[1, 0]).conj()  # == V W^dagger.
+        # Find unitary U2 which maximizes `trace(U dS)`;
         # this yields trace(U dS) = trace(Y), which is maximal.
+        new_U, _ = _polar_max_trace(dS)
         return err, new_U.split_legs([0, 1])
 
 
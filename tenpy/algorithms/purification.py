@@ -3,12 +3,16 @@
 # Copyright 2019-2021 TeNPy Developers, GNU GPLv3
 
 import numpy as np
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 import logging
 logger = logging.getLogger(__name__)
 
 import tenpy.linalg.np_conserved as npc
 from . import tebd
 from ..tools.params import asConfig
+from ..tools.math import entropy
 from .mps_common import VariationalApplyMPO, TwoSiteH
 from .truncation import svd_theta, TruncationError
 from .disentangler import get_disentangler
@@ -94,6 +98,10 @@ class PurificationTEBD(tebd.TEBDEngine):
         disentangle : None | str
             Method for disentangling.
             See :func:`~tenpy.algorithm.disentangler.get_disentangler`.
+        n_threads : int
+            Number of threads used by :meth:`update_step` to update the independent
+            (non-overlapping) bonds of an even/odd sub-sweep in parallel.
+            Defaults to 1, i.e. the usual sequential update.
 
     Attributes
     ----------
@@ -103,14 +111,27 @@ class PurificationTEBD(tebd.TEBDEngine):
         Defaults to the trivial disentangler for ``options['disentangle']=None``.
     _disent_iterations : 1D ndarray
         Number of iterations performed on all bonds, including trivial bonds; lenght `L`.
+    _entropy_bonds : 1D ndarray
+        Current entanglement entropy on all bonds, updated from the singular values
+        of the most recent update of each bond; lenght `L`.
     _guess_U_disent : list of list of npc.Array
         Same index strucuture as `self._U`: for each two-site U of the physical time evolution
         the disentangler from the last application. Initialized to identities.
+    _U_combined : list of list of npc.Array
+        Same index structure as `self._U`: the bond unitaries with the physical legs
+        pre-combined into pipes ``(p0.p1), (p0*.p1*)``, see :meth:`_apply_U_bond`.
+    _U_bond_disent : dict
+        Cache ``(U_idx_dt, i) -> U_bond^dagger`` (relabeled to act on the `q` legs)
+        filled lazily by :class:`~tenpy.algorithms.disentangler.BackwardDisentangler`;
+        cleared whenever :meth:`calc_U` recalculates `self._U`.
     """
     def __init__(self, psi, model, options, **kwargs):
         super().__init__(psi, model, options, **kwargs)
         self._disent_iterations = np.zeros(psi.L)
+        self._entropy_bonds = np.zeros(psi.L)  # kept up to date by the bond updates
         self._guess_U_disent = None  # will be set in calc_U
+        self._U_combined = None  # will be set in calc_U
+        self._U_bond_disent = {}  # cache for BackwardDisentangler, cleared in calc_U
         method = self.options.get('disentangle', None)
         self.used_disentangler = get_disentangler(str(method), self)
 
@@ -134,7 +155,9 @@ class PurificationTEBD(tebd.TEBDEngine):
             "--> beta=%(beta).6f, E_bond=%(E).10f, max(S)=%(S).10f", {
                 'beta': -self.evolved_time.imag,
                 'E': np.average(self.model.bond_energies(self.psi)),
-                'S': np.max(self.psi.entanglement_entropy())
+                # bond entropies were accumulated during the sweeps; re-deriving them
+                # with psi.entanglement_entropy() would cost another pass over the bonds
+                'S': np.max(self._entropy_bonds[self.psi.nontrivial_bonds])
             })
 
     @property
@@ -142,10 +165,97 @@ class PurificationTEBD(tebd.TEBDEngine):
         """For each bond the total number of iterations performed in any :class:`Disentangler`."""
         return self._disent_iterations[self.psi.nontrivial_bonds]
 
+    # make `_update_index` thread-local: with `n_threads` > 1, multiple `update_bond` run
+    # concurrently in :meth:`update_step`, and the disentanglers read it via `self.parent`.
+    @property
+    def _update_index(self):
+        return getattr(self._update_index_threadlocal, 'value', None)
+
+    @_update_index.setter
+    def _update_index(self, value):
+        try:
+            local = self._update_index_threadlocal
+        except AttributeError:  # first assignment happens in TEBDEngine.__init__
+            local = self._update_index_threadlocal = threading.local()
+        local.value = value
+
+    def update_step(self, U_idx_dt, odd):
+        """Update the even or odd bonds of the unit cell, possibly in parallel.
+
+        Same as :meth:`~tenpy.algorithms.tebd.TEBDEngine.update_step`, but if the option
+        ``n_threads`` is larger than 1, the site-disjoint bonds of the sub-sweep are
+        updated concurrently by a thread pool.
+        For an infinite MPS with odd `L`, the bonds of a sub-sweep are *not*
+        site-disjoint (bond ``0`` and bond ``L-1`` share a site), so we always update
+        sequentially in that case.
+        The actual work per bond is BLAS/LAPACK-bound, which releases the GIL;
+        if `threadpoolctl` is installed, BLAS-internal threading is limited to one thread
+        per worker to avoid oversubscription.
+
+        Parameters and return value are the same as for
+        :meth:`~tenpy.algorithms.tebd.TEBDEngine.update_step`.
+        """
+        n_threads = self.options.get('n_threads', 1)
+        if n_threads <= 1:
+            return super().update_step(U_idx_dt, odd)
+        if not self.psi.finite and self.psi.L % 2 == 1:
+            # the even sub-sweep updates both bond 0 (sites L-1, 0) and bond L-1
+            # (sites L-2, L-1), which share site L-1: not safe to update concurrently
+            logger.debug("odd L for infinite MPS: bonds share sites, update sequentially")
+            return super().update_step(U_idx_dt, odd)
+        try:
+            from threadpoolctl import threadpool_limits
+            limit_blas = threadpool_limits(limits=1, user_api='blas')
+        except ImportError:
+            logger.debug("threadpoolctl not available: can't limit BLAS threads")
+            limit_blas = ExitStack()  # no-op context manager
+        Us = self._U[U_idx_dt]
+        trunc_err = TruncationError()
+        bonds = [i for i in range(int(odd) % 2, self.psi.L, 2) if Us[i] is not None]
+
+        def update_one_bond(i_bond):
+            self._update_index = (U_idx_dt, i_bond)
+            try:
+                return self.update_bond(i_bond, Us[i_bond])
+            finally:
+                self._update_index = None
+
+        with limit_blas, ThreadPoolExecutor(max_workers=n_threads) as executor:
+            for err in executor.map(update_one_bond, bonds):
+                trunc_err += err
+        return trunc_err
+
     def calc_U(self, order, delta_t, type_evo='real', E_offset=None):
         """see :meth:`~tenpy.algorithms.tebd.eng.calc_U`"""
         super().calc_U(order, delta_t, type_evo, E_offset)
         self._guess_U_disent = [[None] * len(Us) for Us in self._U]
+        self._U_bond_disent.clear()  # cached daggered U's refer to the old self._U
+        # pre-combine the physical legs of each U_bond once per `calc_U`:
+        # applying it in `update_bond` is then a single matmul on the combined leg.
+        self._U_combined = [[
+            (U.combine_legs([['p0', 'p1'], ['p0*', 'p1*']], qconj=[+1, -1])
+             if U is not None else None) for U in Us
+        ] for Us in self._U]
+
+    def _apply_U_bond(self, U_bond, theta):
+        """Apply a two-site unitary `U_bond` to the ``'p0', 'p1'`` legs of `theta`.
+
+        Uses the pre-combined version from :attr:`_U_combined` (if available for the
+        current :attr:`_update_index`), such that the contraction is a plain matrix
+        product on the combined ``(p0.p1)`` leg.
+        """
+        U_combined = None
+        if self._update_index is not None and self._U_combined is not None:
+            U_idx_dt, i = self._update_index
+            if self._U[U_idx_dt][i] is U_bond:
+                U_combined = self._U_combined[U_idx_dt][i]
+        if U_combined is None:  # e.g. called outside of `update_step`
+            U_combined = U_bond.combine_legs([['p0', 'p1'], ['p0*', 'p1*']], qconj=[+1, -1])
+        # combine theta with the matching pipe to ensure the legs are contractible
+        pipe = U_combined.get_leg('(p0*.p1*)').conj()
+        theta = theta.combine_legs([['p0', 'p1']], pipes=[pipe])
+        theta = npc.tensordot(U_combined, theta, axes=['(p0*.p1*)', '(p0.p1)'])
+        return theta.split_legs('(p0.p1)')
 
     def update_bond(self, i, U_bond):
         """Updates the B matrices on a given bond.
@@ -178,12 +288,24 @@ class PurificationTEBD(tebd.TEBDEngine):
         """
         i0, i1 = i - 1, i
         logger.debug("Update sites (%d, %d)", i0, i1)
-        # Construct the theta matrix
-        theta = self.psi.get_theta(i0, n=2)  # 'vL', 'vR', 'p0', 'p1', 'q0', 'q1'
-        theta = npc.tensordot(U_bond, theta, axes=(['p0*', 'p1*'], ['p0', 'p1']))
+        # Construct C and theta: C is the same as theta, but without the `S` on the very left.
+        # (Note: this requires no inverse if the MPS is initially in 'B' canonical form.)
+        # Deriving theta from C (instead of a second `get_theta` call) re-walks the
+        # MPS tensors and applies `U_bond` only once per bond.
+        C = self.psi.get_theta(i0, n=2, formL=0.)  # 'vL', 'vR', 'p0', 'p1', 'q0', 'q1'
+        C = self._apply_U_bond(U_bond, C)
+        # transpose here such that the `combine_legs` below (for both C and theta)
+        # don't need to permute the axes again
+        C.itranspose(['vL', 'p0', 'q0', 'vR', 'p1', 'q1'])
+        theta = C.scale_axis(self.psi.get_SL(i0), 'vL')
+        # now theta is the same as if we had done
+        #   theta = self.psi.get_theta(i0, n=2)
+        #   theta = self._apply_U_bond(U_bond, theta)
         # ##### new hook compared to tebd.TEBDEngine.calc_U
         theta, U_disent = self.disentangle(theta)
         # ####
+        if U_disent is not None:
+            C = npc.tensordot(U_disent, C, axes=[['q0*', 'q1*'], ['q0', 'q1']])
         theta = theta.combine_legs([('vL', 'p0', 'q0'), ('vR', 'p1', 'q1')], qconj=[+1, -1])
 
         # Perform the SVD and truncate the wavefunction
@@ -199,14 +321,8 @@ class PurificationTEBD(tebd.TEBDEngine):
         #      B_L = B_L.ireplace_labels(['p0', 'q0'], ['p', 'q'])
         # i.e. with SL = self.psi.get_SL(i0), we have ``B_L = SL**(-1) U S``
         # However, the inverse of SL is problematic, as it might contain very small singular
-        # values.  Instead, we calculate ``C == SL**-1 theta == SL**-1 U S V``,
+        # values.  Instead, we use ``C == SL**-1 theta == SL**-1 U S V``,
         # such that we obtain ``B_L = SL**-1 U S = SL**-1 U S V V^dagger = C V^dagger``
-        C = self.psi.get_theta(i0, n=2, formL=0.)
-        # here, C is the same as theta, but without the `S` on the very left
-        # (Note: this requires no inverse if the MPS is initially in 'B' canonical form)
-        C = npc.tensordot(U_bond, C, axes=(['p0*', 'p1*'], ['p0', 'p1']))  # apply U as for theta
-        if U_disent is not None:
-            C = npc.tensordot(U_disent, C, axes=[['q0*', 'q1*'], ['q0', 'q1']])
         B_L = npc.tensordot(C.combine_legs(('vR', 'p1', 'q1'), pipes=theta.legs[1]),
                             V.conj(),
                             axes=['(vR.p1.q1)', '(vR*.p1*.q1*)'])
@@ -216,6 +332,7 @@ class PurificationTEBD(tebd.TEBDEngine):
         self.psi.set_B(i0, B_L, form='B')
         self.psi.set_B(i1, B_R, form='B')
         self._trunc_err_bonds[i] = self._trunc_err_bonds[i] + trunc_err
+        self._entropy_bonds[i] = entropy(S**2)
         return trunc_err
 
     def update_bond_imag(self, i, U_bond):
@@ -243,7 +360,8 @@ class PurificationTEBD(tebd.TEBDEngine):
         logger.debug("Update sites (%d, %d)", i0, i1)
         # Construct the theta matrix
         theta = self.psi.get_theta(i0, n=2)  # 'vL', 'vR', 'p0', 'q0', 'p1', 'q1'
-        theta = npc.tensordot(U_bond, theta, axes=(['p0*', 'p1*'], ['p0', 'p1']))
+        theta = self._apply_U_bond(U_bond, theta)
+        theta.itranspose(['vL', 'p0', 'q0', 'vR', 'p1', 'q1'])  # combine_legs without transpose
         theta = theta.combine_legs([('vL', 'p0', 'q0'), ('vR', 'p1', 'q1')], qconj=[+1, -1])
         # Perform the SVD and truncate the wavefunction
         U, S, V, trunc_err, renormalize = svd_theta(theta,
@@ -256,6 +374,7 @@ class PurificationTEBD(tebd.TEBDEngine):
         self.psi.set_B(i0, A_L, form='A')
         self.psi.set_B(i1, B_R, form='B')
         self._trunc_err_bonds[i] = self._trunc_err_bonds[i] + trunc_err
+        self._entropy_bonds[i] = entropy(S**2)
         return trunc_err
 
     def disentangle(self, theta):
@@ -400,12 +519,18 @@ class PurificationTEBD(tebd.TEBDEngine):
         """swap sites (i-1, i) (if swap = True) """
         # very similar to update_bond
         i0, i1 = i - 1, i
-        # Construct the theta matrix
-        theta = self.psi.get_theta(i0, n=2)  # 'vL', 'vR', 'p0', 'p1', 'q0', 'q1'
+        # Construct C and theta, as in `update_bond`: theta = SL C, so a single walk
+        # through the MPS tensors yields both
+        C = self.psi.get_theta(i0, n=2, formL=0.)  # 'vL', 'vR', 'p0', 'p1', 'q0', 'q1'
         if swap:
-            theta.ireplace_labels(['p0', 'q0', 'p1', 'q1'], ['p1', 'q1', 'p0', 'q0'])
+            C.ireplace_labels(['p0', 'q0', 'p1', 'q1'], ['p1', 'q1', 'p0', 'q0'])
+        C.itranspose(['vL', 'p0', 'q0', 'vR', 'p1', 'q1'])
+        theta = C.scale_axis(self.psi.get_SL(i0), 'vL')
+        U_disent = None
         if disentangle:
             theta, U_disent = self.disentangle(theta)
+            if U_disent is not None:
+                C = npc.tensordot(U_disent, C, axes=[['q0*', 'q1*'], ['q0', 'q1']])
         theta = theta.combine_legs([('vL', 'p0', 'q0'), ('vR', 'p1', 'q1')], qconj=[+1, -1])
 
         # Perform the SVD and truncate the wavefunction
@@ -415,11 +540,6 @@ class PurificationTEBD(tebd.TEBDEngine):
 
         # bring back to right-canonical 'B' form and update matrices
         B_R = V.split_legs(1).ireplace_labels(['p1', 'q1'], ['p', 'q'])
-        C = self.psi.get_theta(i0, n=2, formL=0.)
-        if swap:
-            C.ireplace_labels(['p0', 'q0', 'p1', 'q1'], ['p1', 'q1', 'p0', 'q0'])
-        if disentangle and U_disent is not None:
-            C = npc.tensordot(U_disent, C, axes=[['q0*', 'q1*'], ['q0', 'q1']])
         B_L = npc.tensordot(C.combine_legs(('vR', 'p1', 'q1'), pipes=theta.legs[1]),
                             V.conj(),
                             axes=['(vR.p1.q1)', '(vR*.p1*.q1*)'])
@@ -429,6 +549,7 @@ class PurificationTEBD(tebd.TEBDEngine):
         self.psi.set_B(i0, B_L, form='B')
         self.psi.set_B(i1, B_R, form='B')
         self._trunc_err_bonds[i] = self._trunc_err_bonds[i] + trunc_err
+        self._entropy_bonds[i] = entropy(S**2)
         return trunc_err
 
 
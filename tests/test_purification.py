@@ -115,6 +115,71 @@ def test_purification_TEBD(L=3):
             eng.disentangle_global()
 
 
+def test_purification_TEBD_parallel(L=4):
+    xxz_pars = dict(L=L, Jxx=1., Jz=3., hz=0., bc_MPS='finite')
+    M = XXZChain(xxz_pars)
+    TEBD_params = {
+        'trunc_params': {
+            'chi_max': 16,
+            'svd_min': 1.e-8
+        },
+        'disentangle': 'renyi',
+        'dt': 0.1,
+        'N_steps': 2
+    }
+    psis = []
+    for n_threads in [1, 2]:
+        psi = purification_mps.PurificationMPS.from_infiniteT(M.lat.mps_sites(), bc='finite')
+        eng = PurificationTEBD(psi, M, dict(TEBD_params, n_threads=n_threads))
+        eng.run()
+        N = psi.expectation_value('Id')  # check normalization : <1> =?= 1
+        npt.assert_array_almost_equal_nulp(N, np.ones([L]), 100)
+        psis.append(psi)
+    # updating non-overlapping bonds in parallel shouldn't change the evolution
+    npt.assert_allclose(psis[0].expectation_value('Sz'), psis[1].expectation_value('Sz'),
+                        atol=1.e-13)
+
+
+def test_renyi_disentangler_trivial_charges(L=4):
+    # no conserved charges: RenyiDisentangler takes the dense single-block path
+    from tenpy.models.spins import SpinChain
+    M = SpinChain(dict(L=L, conserve=None, bc_MPS='finite'))
+    psi = purification_mps.PurificationMPS.from_infiniteT(M.lat.mps_sites(), bc='finite')
+    TEBD_params = {
+        'trunc_params': {
+            'chi_max': 16,
+            'svd_min': 1.e-8
+        },
+        'disentangle': 'renyi',
+        'dt': 0.1,
+        'N_steps': 2
+    }
+    eng = PurificationTEBD(psi, M, TEBD_params)
+    eng.run()
+    N = psi.expectation_value('Id')  # check normalization : <1> =?= 1
+    npt.assert_array_almost_equal_nulp(N, np.ones([L]), 100)
+
+
+def test_purification_TEBD_mixed_prec(L=4):
+    xxz_pars = dict(L=L, Jxx=1., Jz=3., hz=0., bc_MPS='finite')
+    M = XXZChain(xxz_pars)
+    psi = purification_mps.PurificationMPS.from_infiniteT(M.lat.mps_sites(), bc='finite')
+    TEBD_params = {
+        'trunc_params': {
+            'chi_max': 16,
+            'svd_min': 1.e-8
+        },
+        'disentangle': 'renyi',
+        'disent_mixed_prec': True,
+        'dt': 0.1,
+        'N_steps': 2
+    }
+    eng = PurificationTEBD(psi, M, TEBD_params)
+    eng.run()
+    N = psi.expectation_value('Id')  # check normalization : <1> =?= 1
+    npt.assert_array_almost_equal_nulp(N, np.ones([L]), 100)
+
+
 def test_purification_MPO(L=6):
     xxz_pars = dict(L=L, Jxx=1., Jz=2., hz=0., bc_MPS='finite')
     M = XXZChain(xxz_pars)